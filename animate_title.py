@@ -5,8 +5,14 @@ Usage: animate_title.py start|stop|run
 """
 import sys
 import os
+import fcntl
+import json
 import signal
 import subprocess
+import time
+from contextlib import contextmanager
+from functools import reduce
+from math import gcd
 
 MOON_PHASES = ['🌑', '🌒', '🌓', '🌔', '🌕', '🌖', '🌗', '🌘']
 
@@ -45,43 +51,17 @@ FIRE_BURST = [
 ]
 
 
-def get_ancestor_pids():
-    """Walk up the process tree and return all ancestor PIDs."""
-    pids = set()
-    pid = os.getpid()
-    while pid > 1:
-        pids.add(pid)
-        try:
-            result = subprocess.run(
-                ['ps', '-o', 'ppid=', '-p', str(pid)],
-                capture_output=True, text=True
-            )
-            if result.returncode != 0:
-                break
-            pid = int(result.stdout.strip())
-        except (ValueError, subprocess.SubprocessError):
-            break
-    return pids
-
-
-def find_session_id_by_process_tree():
-    """Find the iTerm session ID by matching process tree."""
+def find_session_id():
+    """Find the iTerm session ID by controlling tty, then process tree."""
     import iterm2
+    import session_tty
 
-    ancestor_pids = get_ancestor_pids()
+    resolution = session_tty.start_resolution()
 
     async def find_session(connection):
         app = await iterm2.async_get_app(connection)
-        for window in app.terminal_windows:
-            for tab in window.tabs:
-                for session in tab.sessions:
-                    try:
-                        session_pid = await session.async_get_variable('pid')
-                        if session_pid and int(session_pid) in ancestor_pids:
-                            return session.session_id
-                    except Exception:
-                        continue
-        return None
+        session = await session_tty.find_session(app, resolution, focused=False)
+        return session.session_id if session else None
 
     try:
         return iterm2.run_until_complete(find_session)
@@ -97,7 +77,7 @@ def get_session_id():
     if not session_id:
         session_id = os.environ.get('ANIMATE_TITLE_SESSION_ID', '')
     if not session_id:
-        session_id = find_session_id_by_process_tree()
+        session_id = find_session_id()
     return session_id
 
 
@@ -116,23 +96,110 @@ def get_title_file(session_id=None):
     safe_id = session_id.replace(':', '_').replace('/', '_')
     return f'/tmp/iterm_original_title_{safe_id}.txt'
 
+
+def get_queue_file(session_id=None):
+    """Get session-specific command queue file (also used as the lock)."""
+    if not session_id:
+        session_id = get_session_id() or 'default'
+    safe_id = session_id.replace(':', '_').replace('/', '_')
+    return f'/tmp/iterm_animation_{safe_id}.queue'
+
+
+def get_stats_file(session_id=None):
+    """Get session-specific animation counters file."""
+    if not session_id:
+        session_id = get_session_id() or 'default'
+    safe_id = session_id.replace(':', '_').replace('/', '_')
+    return f'/tmp/iterm_animation_{safe_id}.stats'
+
 REFRESH_RATE = 0.1  # 100ms (faster spin)
 
+# Seconds between frames while the session can't be seen (app inactive or
+# its tab not selected). None pauses the animation until it is visible.
+HIDDEN_REFRESH_RATE = 2.0
+
+# How long a command waits for a newer one before it is applied.
+# start/stop/start arriving inside this window collapse to the last one.
+COALESCE_WINDOW = 0.02
+
+# Worker mode spawned for each user-facing command
+WORKER_MODES = {
+    'start': 'run',
+    'stop': 'restore',
+    'burst': 'run_burst',
+}
+
+# Signals handled by a running animation daemon in place of a new worker
+DAEMON_SIGNALS = {
+    'stop': signal.SIGTERM,
+    'burst': signal.SIGUSR1,
+}
+
+# Seconds a stopping worker gets (burst + restore) before SIGKILL
+STOP_TIMEOUT = 2.0
+
+
+async def play_burst(session, base_title):
+    """Play the fire burst on both sides of base_title."""
+    import asyncio
+
+    for fire in FIRE_BURST:
+        title = f'{fire} {base_title} {fire}'
+        try:
+            await session.async_set_name(title)
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)  # 100ms per frame
+
+
+def build_titles(name):
+    """Every animation frame for name, built once so the loop allocates none.
+
+    The sequence repeats after the least common multiple of all frame
+    counts.
+    """
+    lengths = [len(MOON_PHASES)] + [len(frames) for frames in END_ANIMATIONS]
+    period = reduce(lambda a, b: a * b // gcd(a, b), lengths)
+    titles = []
+    for idx in range(period):
+        moon = MOON_PHASES[idx % len(MOON_PHASES)]
+        end_section = ''.join(frames[idx % len(frames)] for frames in END_ANIMATIONS)
+        titles.append(f'{moon} {name} {end_section}')
+    return titles
+
+
+def write_stats(stats_file, stats):
+    """Record animation counters so they can be read from outside."""
+    try:
+        with open(stats_file, 'w') as f:
+            json.dump(stats, f)
+    except OSError:
+        pass
+
 
 def run_animation():
     """Actually run the animation loop (called in background process)."""
     import asyncio
     import iterm2
+    import daemon
 
     # Get session ID from environment (passed by start())
     session_id = os.environ.get('ANIMATE_TITLE_SESSION_ID', '')
     title_file = get_title_file(session_id)
+    stats_file = get_stats_file(session_id)
+
+    # stop()/burst() signals stay pending until a connection can act on
+    # them; with the default action they would kill us before the name is
+    # restored and leave a stale PID file behind.
+    signal.pthread_sigmask(signal.SIG_BLOCK, DAEMON_SIGNALS.values())
 
     async def animate_loop(connection):
         app = await iterm2.async_get_app(connection)
 
         # Find the target session
         session = app.get_session_by_id(session_id) if session_id else None
+        if session_id and not session:
+            raise daemon.SessionGone(session_id)
         if not session:
             # Fallback to current session
             window = app.current_window
@@ -142,33 +209,167 @@ def run_animation():
         if not session:
             return
 
-        # Save original session name
-        original_name = session.name or 'Terminal'
-        with open(title_file, 'w') as f:
-            f.write(original_name)
+        # Save original session name. If a previous worker was interrupted
+        # before restoring, the title file still holds the real original and
+        # session.name is an animated frame - keep the saved one.
+        if os.path.exists(title_file):
+            with open(title_file) as f:
+                original_name = f.read().strip() or 'Terminal'
+        else:
+            original_name = session.name or 'Terminal'
+            with open(title_file, 'w') as f:
+                f.write(original_name)
+
+        titles = build_titles(original_name)
+
+        # Capture what visibility tracking needs, then drop the app model:
+        # from here on only focus and termination notifications are used,
+        # plus a layout query when a tab we don't know is selected.
+        window, tab = app.get_window_and_tab_for_session(session)
+        our_tab = tab.tab_id if tab else None
+        window_tabs = {t.tab_id for t in window.tabs} if window else set()
+        other_tabs = {t.tab_id for w in app.terminal_windows for t in w.tabs} - window_tabs
+        focus = {
+            'app_active': app.app_active is not False,
+            'tab_selected': tab is None or window.current_tab is tab,
+        }
+        await daemon.async_release_app(connection, app)
+        app = window = tab = None
+
+        # Woken on any focus change so a hidden animation resumes at once
+        wake = asyncio.Event()
+
+        async def refresh_tabs():
+            """Re-read which tabs share our window (e.g. after Cmd-T)."""
+            response = await iterm2.rpc.async_list_sessions(connection)
+            window_tabs.clear()
+            other_tabs.clear()
+            for w in response.list_sessions_response.windows:
+                tab_ids = {t.tab_id for t in w.tabs}
+                (window_tabs if our_tab in tab_ids else other_tabs).update(tab_ids)
+
+        async def watch_focus():
+            async with iterm2.FocusMonitor(connection) as monitor:
+                while True:
+                    update = await monitor.async_get_next_update()
+                    if update.application_active:
+                        focus['app_active'] = update.application_active.application_active
+                    elif update.selected_tab_changed and our_tab:
+                        tab_id = update.selected_tab_changed.tab_id
+                        if tab_id not in window_tabs and tab_id not in other_tabs:
+                            try:
+                                await refresh_tabs()
+                            except Exception:
+                                pass
+                        # Tabs in other windows don't hide ours; a tab still
+                        # unknown is most likely new in our window, so it does
+                        if tab_id not in other_tabs:
+                            focus['tab_selected'] = tab_id == our_tab
+                    wake.set()
+
+        async def watch_termination():
+            async with iterm2.SessionTerminationMonitor(connection) as monitor:
+                while await monitor.async_get() != session.session_id:
+                    pass
+
+        def is_visible():
+            return focus['app_active'] and focus['tab_selected']
+
+        focus_task = asyncio.ensure_future(watch_focus())
+        gone_task = asyncio.ensure_future(watch_termination())
+        gone_task.add_done_callback(lambda _task: wake.set())
+        stats = {'frames_drawn': 0, 'frames_skipped': 0, 'visible': True}
+        footprint = daemon.Footprint('animation', session_id)
+        loop = asyncio.get_running_loop()
+
+        # stop()/burst() signal us instead of killing us: the current frame
+        # finishes, then we restore the name over this same connection.
+        exit_mode = None
+
+        def request_exit(mode):
+            nonlocal exit_mode
+            if exit_mode != 'burst':
+                exit_mode = mode
+            wake.set()
+
+        for mode, sig in DAEMON_SIGNALS.items():
+            loop.add_signal_handler(sig, request_exit, mode)
+        # Signals that arrived while connecting are delivered now
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, DAEMON_SIGNALS.values())
 
-        idx = 0
-        while True:
-            moon = MOON_PHASES[idx % len(MOON_PHASES)]
-
-            # Build end animations
-            end_section = ''.join(frames[idx % len(frames)] for frames in END_ANIMATIONS)
-
-            title = f'{moon} {original_name} {end_section}'
-            try:
-                await session.async_set_name(title)
-            except Exception:
-                pass
-            await asyncio.sleep(REFRESH_RATE)
-            idx += 1
+        try:
+            idx = 0
+            visible = is_visible()
+            while exit_mode is None:
+                # Cleared before the frame write, not after: a signal or
+                # focus change arriving during the write must still cut
+                # the next wait short
+                wake.clear()
+                if visible or HIDDEN_REFRESH_RATE is not None:
+                    try:
+                        await session.async_set_name(titles[idx])
+                    except Exception:
+                        pass
+                    stats['frames_drawn'] += 1
+                    footprint.frame()
+                    idx = (idx + 1) % len(titles)
+
+                waited_from = loop.time()
+                try:
+                    await asyncio.wait_for(
+                        wake.wait(), REFRESH_RATE if visible else HIDDEN_REFRESH_RATE)
+                except asyncio.TimeoutError:
+                    pass
+
+                if exit_mode:
+                    break
+
+                if gone_task.done():
+                    gone_task.result()  # Re-raise subscription errors
+                    raise daemon.SessionGone(session.session_id)
+
+                footprint.check()
+
+                if not visible:
+                    # Frames a full-rate loop would have drawn meanwhile
+                    missed = int((loop.time() - waited_from) / REFRESH_RATE)
+                    stats['frames_skipped'] += max(missed - 1, 0)
+
+                now_visible = is_visible()
+                if now_visible != visible:
+                    visible = now_visible
+                    stats['visible'] = visible
+                    write_stats(stats_file, stats)
+        finally:
+            # Keep later signals pending for the next connection rather
+            # than handing them to this loop once it has stopped
+            signal.pthread_sigmask(signal.SIG_BLOCK, DAEMON_SIGNALS.values())
+            for sig in DAEMON_SIGNALS.values():
+                loop.remove_signal_handler(sig)
+            focus_task.cancel()
+            gone_task.cancel()
+
+        if exit_mode == 'burst':
+            await play_burst(session, original_name)
+        try:
+            await session.async_set_name(original_name)
+        except Exception:
+            pass
 
-    async def main(connection):
-        await animate_loop(connection)
+        write_stats(stats_file, stats)
+        try:
+            os.remove(title_file)
+        except FileNotFoundError:
+            pass
 
-    try:
-        iterm2.run_until_complete(main, retry=True)
-    except Exception:
-        pass
+    status = daemon.run(animate_loop, 'animation', session_id)
+    if status == 'session-gone':
+        # Nothing left to restore the name on
+        try:
+            os.remove(title_file)
+        except FileNotFoundError:
+            pass
+    release_pid_file(session_id)
 
 
 def run_restore():
@@ -209,7 +410,6 @@ def run_restore():
 
 def run_burst():
     """Play fire burst animation on both sides, then restore name."""
-    import asyncio
     import iterm2
 
     session_id = os.environ.get('ANIMATE_TITLE_SESSION_ID', '')
@@ -234,14 +434,7 @@ def run_burst():
         if not session:
             return
 
-        # Play the burst on both sides
-        for fire in FIRE_BURST:
-            title = f'{fire} {base_title} {fire}'
-            try:
-                await session.async_set_name(title)
-            except Exception:
-                pass
-            await asyncio.sleep(0.1)  # 100ms per frame
+        await play_burst(session, base_title)
 
         # Restore to just the base title
         await session.async_set_name(base_title)
@@ -251,37 +444,145 @@ def run_burst():
     except Exception:
         pass
 
+    try:
+        os.remove(title_file)
+    except FileNotFoundError:
+        pass
+
 
-def stop_process(session_id=None):
-    """Stop any running animation process."""
+def read_pid_file(session_id):
+    """Return (pid, worker mode) of the session's worker, or (None, '').
+
+    A PID file left behind by a worker that no longer runs is removed, so
+    its PID is never signalled after being reused.
+    """
     pid_file = get_pid_file(session_id)
-    if os.path.exists(pid_file):
+    try:
+        with open(pid_file) as f:
+            parts = f.read().split()
+        pid, mode = int(parts[0]), (parts[1] if len(parts) > 1 else '')
+    except (FileNotFoundError, IndexError, ValueError):
+        return None, ''
+    if not is_running(pid):
         try:
-            with open(pid_file) as f:
-                pid = int(f.read().strip())
-            os.kill(pid, signal.SIGTERM)
-        except (ProcessLookupError, ValueError, FileNotFoundError, PermissionError):
+            os.remove(pid_file)
+        except FileNotFoundError:
             pass
+        return None, ''
+    return pid, mode
+
+
+def release_pid_file(session_id):
+    """Remove the PID file if it still belongs to this process."""
+    if read_pid_file(session_id)[0] == os.getpid():
         try:
-            os.remove(pid_file)
+            os.remove(get_pid_file(session_id))
         except FileNotFoundError:
             pass
 
 
-def start():
-    """Start animation as detached background process."""
-    # Detect session ID BEFORE detaching
-    session_id = get_session_id()
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def wait_released(session_id, pid):
+    """Wait up to STOP_TIMEOUT for pid to release the session's PID file.
+
+    Workers release it once they have restored the name. Returns False if
+    pid still holds it.
+    """
+    deadline = time.monotonic() + STOP_TIMEOUT
+    while read_pid_file(session_id)[0] == pid:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def kill_worker(session_id, pid):
+    """SIGKILL pid if it still holds the PID file, then remove the file."""
+    if pid and read_pid_file(session_id)[0] == pid:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    try:
+        os.remove(get_pid_file(session_id))
+    except FileNotFoundError:
+        pass
+
+
+def stop_process(session_id=None):
+    """Stop any running worker and wait for it to exit.
+
+    The animation daemon restores the name on SIGTERM, so it gets
+    STOP_TIMEOUT to finish before it is killed outright.
+    """
+    pid, _mode = read_pid_file(session_id)
+    if pid:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+        else:
+            wait_released(session_id, pid)
+    kill_worker(session_id, pid)
+
+
+def signal_daemon(session_id, sig):
+    """Send sig to the session's animation daemon; its PID, or None if none runs."""
+    pid, mode = read_pid_file(session_id)
+    if not pid or mode != 'run':
+        return None
+    try:
+        os.kill(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        return None
+    return pid
+
+
+@contextmanager
+def session_lock(session_id):
+    """Hold the per-session queue lock; yields the open queue file."""
+    fd = os.open(get_queue_file(session_id), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield fd
+    finally:
+        os.close(fd)
+
+
+def read_queue(fd):
+    """Return (generation, command) of the most recently submitted command."""
+    os.lseek(fd, 0, os.SEEK_SET)
+    parts = os.read(fd, 64).decode().split()
+    try:
+        return int(parts[0]), parts[1]
+    except (IndexError, ValueError):
+        return 0, ''
 
-    stop_process(session_id)
 
-    # Pass session ID to daemon via environment variable
+def write_queue(fd, generation, cmd):
+    os.ftruncate(fd, 0)
+    os.lseek(fd, 0, os.SEEK_SET)
+    os.write(fd, f'{generation} {cmd}'.encode())
+
+
+def spawn_worker(session_id, mode):
+    """Start a detached worker for this session and record its PID."""
+    # Pass session ID to the worker via environment variable
     env = os.environ.copy()
     if session_id:
         env['ANIMATE_TITLE_SESSION_ID'] = session_id
 
     proc = subprocess.Popen(
-        [sys.executable, __file__, 'run'],
+        [sys.executable, __file__, mode],
         env=env,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
@@ -291,52 +592,72 @@ def start():
 
     pid_file = get_pid_file(session_id)
     with open(pid_file, 'w') as f:
-        f.write(str(proc.pid))
+        f.write(f'{proc.pid} {mode}')
 
 
-def stop():
-    """Stop animation and restore name (non-blocking)."""
+def submit(cmd):
+    """Queue a command for this session; only the newest one is applied.
+
+    Overlapping hooks each bump the session's generation counter, wait
+    COALESCE_WINDOW, and then only the command that still holds the latest
+    generation kills the current worker and spawns its own. Superseded
+    commands return without spawning anything, and because kill + spawn
+    happen under the session lock there is at most one worker per session.
+    """
+    # Detect session ID BEFORE detaching
     session_id = get_session_id()
-    stop_process(session_id)
 
-    # Pass session ID to restore process
-    env = os.environ.copy()
-    if session_id:
-        env['ANIMATE_TITLE_SESSION_ID'] = session_id
+    with session_lock(session_id) as fd:
+        generation = read_queue(fd)[0] + 1
+        write_queue(fd, generation, cmd)
+
+    time.sleep(COALESCE_WINDOW)
+
+    with session_lock(session_id) as fd:
+        if read_queue(fd)[0] != generation:
+            return  # Superseded by a newer command
+        if cmd in DAEMON_SIGNALS:
+            pid = signal_daemon(session_id, DAEMON_SIGNALS[cmd])
+            if pid:
+                if wait_released(session_id, pid):
+                    return  # The daemon played the burst and restored by itself
+                # The daemon didn't act (e.g. it is between connections);
+                # replace it with a worker that does
+                kill_worker(session_id, pid)
+        stop_process(session_id)
+        if cmd == 'stop' and not os.path.exists(get_title_file(session_id)):
+            return  # Nothing to restore
+        spawn_worker(session_id, WORKER_MODES[cmd])
 
-    subprocess.Popen(
-        [sys.executable, __file__, 'restore'],
-        env=env,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-        stdin=subprocess.DEVNULL,
-        start_new_session=True,
-    )
+
+def start():
+    """Start animation as detached background process."""
+    submit('start')
 
 
-def burst():
-    """Play fire burst animation (non-blocking)."""
-    session_id = get_session_id()
-    stop_process(session_id)
+def stop():
+    """Stop animation and restore name.
 
-    # Pass session ID to burst process
-    env = os.environ.copy()
-    if session_id:
-        env['ANIMATE_TITLE_SESSION_ID'] = session_id
+    A running daemon restores the name itself over its connection; a
+    restore worker is only spawned when there is no daemon to signal or it
+    doesn't finish within STOP_TIMEOUT.
+    """
+    submit('stop')
 
-    subprocess.Popen(
-        [sys.executable, __file__, 'run_burst'],
-        env=env,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-        stdin=subprocess.DEVNULL,
-        start_new_session=True,
-    )
+
+def burst():
+    """Play fire burst animation and restore name.
+
+    Blocks while a running daemon plays the burst (about a second, at most
+    STOP_TIMEOUT); without a daemon a detached burst worker plays it and
+    this returns at once.
+    """
+    submit('burst')
 
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print('Usage: animate_title.py start|stop|burst')
+        print('Usage: animate_title.py start|stop|burst|health')
         sys.exit(1)
 
     cmd = sys.argv[1].lower()
@@ -352,3 +673,6 @@ if __name__ == '__main__':
         run_restore()
     elif cmd == 'run_burst':
         run_burst()
+    elif cmd == 'health':
+        import daemon
+        print(daemon.read_health('animation', get_session_id()))
@@ -0,0 +1,231 @@
+"""
+Connection policy, health records and footprint tracking for the background
+daemons (animate_title.py run, typing_monitor.py run).
+
+Instead of retrying forever, a daemon reconnects with exponential backoff
+and jitter, gives up after RETRY_WINDOW seconds without a connection that
+stays up for RETRY_STABLE seconds, and
+exits cleanly once its target session is confirmed gone. Every state change
+is written to /tmp/iterm_<daemon>_<session>.health so it can be checked
+without attaching to the process.
+
+Daemons drop the iterm2 app model once their session is resolved. Their
+current RSS and allocation rate are part of the health record; staying
+under RSS_BUDGET_MB is checked by tests/test_footprint.py, not enforced at
+run time.
+"""
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+# ====== CONFIGURATION SECTION ======
+RETRY_BASE = 0.5      # First reconnect delay (seconds)
+RETRY_CAP = 30.0      # Longest delay between reconnects
+RETRY_WINDOW = 300.0  # Give up after this long without a working connection
+RETRY_STABLE = 60.0   # A connection kept this long starts a fresh window
+RSS_BUDGET_MB = 48    # Resident memory a daemon should stay under
+FOOTPRINT_INTERVAL = 30.0  # Seconds between footprint checks
+# ====== END CONFIGURATION SECTION ======
+
+
+class SessionGone(Exception):
+    """Raised by a daemon when its target session no longer exists."""
+
+
+def get_health_file(name, session_id):
+    """Get daemon- and session-specific health file."""
+    safe_id = session_id.replace(':', '_').replace('/', '_') if session_id else 'default'
+    return f'/tmp/iterm_{name}_{safe_id}.health'
+
+
+def write_health(name, session_id, status, attempts=0, error=None, **footprint):
+    """Record the daemon's current status, last error and footprint."""
+    record = {
+        'daemon': name,
+        'pid': os.getpid(),
+        'session_id': session_id,
+        'status': status,
+        'attempts': attempts,
+        'last_error': repr(error) if error else None,
+        'updated': time.time(),
+        **footprint,
+    }
+    try:
+        with open(get_health_file(name, session_id), 'w') as f:
+            json.dump(record, f)
+    except OSError:
+        pass
+
+
+def read_health(name, session_id):
+    """Return the last health record, or None if there is none."""
+    try:
+        with open(get_health_file(name, session_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def current_rss_kb():
+    """Current resident set size of this process in KB, or None if unknown.
+
+    Read from /proc without forking where available, otherwise with ps.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (FileNotFoundError, IndexError, ValueError):
+        pass
+    try:
+        result = subprocess.run(
+            ['ps', '-o', 'rss=', '-p', str(os.getpid())],
+            capture_output=True, text=True
+        )
+        return int(result.stdout.strip())
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+class Footprint:
+    """Records a daemon loop's current RSS and allocation rate.
+
+    frame() is cheap enough to call every iteration; check() only measures
+    every FOOTPRINT_INTERVAL seconds and writes the result to the health
+    record.
+    """
+
+    def __init__(self, name, session_id):
+        self.name = name
+        self.session_id = session_id
+        self.frames = 0
+        self.blocks = sys.getallocatedblocks()
+        self.checked = time.monotonic()
+
+    def frame(self):
+        self.frames += 1
+
+    def check(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.checked < FOOTPRINT_INTERVAL:
+            return
+        rss_kb = current_rss_kb()
+        blocks = sys.getallocatedblocks()
+        # Net live allocations per frame since the last check; a loop that
+        # allocates nothing it keeps stays at ~0
+        blocks_per_frame = (blocks - self.blocks) / max(self.frames, 1)
+        write_health(self.name, self.session_id, 'connected',
+                     rss_kb=rss_kb, rss_budget_kb=RSS_BUDGET_MB * 1024,
+                     blocks_per_frame=round(blocks_per_frame, 2))
+        self.frames = 0
+        self.blocks = blocks
+        self.checked = now
+
+
+async def async_release_app(connection, app):
+    """Drop the app model once the daemon has what it needs from it.
+
+    Unsubscribes the app's layout, focus and session notifications and
+    forgets the window hierarchy. Session objects keep working for
+    per-session calls (name, profile, variables); the daemon subscribes to
+    just the notifications it needs instead.
+    """
+    import iterm2
+    import iterm2.notifications
+
+    for token in app.tokens:
+        try:
+            await iterm2.notifications.async_unsubscribe(connection, token)
+        except Exception:
+            pass
+    app.tokens = []
+    iterm2.app.invalidate_app()
+    iterm2.Session.delegate = None
+    iterm2.Tab.delegate = None
+    iterm2.Window.delegate = None
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with jitter for the given failed attempt (1-based)."""
+    delay = min(RETRY_CAP, RETRY_BASE * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run(main, name, session_id):
+    """Run main(connection) with bounded reconnects.
+
+    Returns 'exited' when main returns, 'session-gone' when it raises
+    SessionGone, or 'gave-up' when no connection could be kept up within
+    RETRY_WINDOW. Errors from main count against the window like failed
+    connects unless main ran for RETRY_STABLE seconds first, so a main that
+    fails right after connecting doesn't reconnect forever.
+    """
+    import iterm2
+
+    attempts = 0
+    failing_since = None
+
+    while True:
+        outcome = {}
+
+        async def guarded(connection):
+            outcome['connected_at'] = time.monotonic()
+            write_health(name, session_id, 'connected', attempts)
+
+            # A dropped connection never answers pending RPCs; notice it
+            # instead of waiting forever.
+            task = asyncio.ensure_future(main(connection))
+            closed = asyncio.ensure_future(connection.websocket.wait_closed())
+            await asyncio.wait([task, closed], return_when=asyncio.FIRST_COMPLETED)
+            closed.cancel()
+            if not task.done():
+                task.cancel()
+                outcome['error'] = ConnectionError('connection to iTerm2 closed')
+                return
+            try:
+                task.result()
+            except SessionGone:
+                outcome['status'] = 'session-gone'
+            except Exception as err:
+                outcome['error'] = err
+
+        connection = iterm2.Connection()
+        try:
+            # Not iterm2.run_until_complete(): it turns a refused connection
+            # into sys.exit(1), which would end the daemon on the first
+            # attempt instead of backing off
+            connection.run_until_complete(guarded, False)
+        except (Exception, SystemExit) as err:
+            outcome['error'] = err
+        finally:
+            # Each attempt gets a new event loop that iterm2 leaves open;
+            # close it so reconnects don't leak its file descriptors
+            if connection.loop is not None:
+                connection.loop.close()
+
+        error = outcome.get('error')
+        if outcome.get('status'):
+            write_health(name, session_id, outcome['status'], error=error)
+            return outcome['status']
+        if not error:
+            write_health(name, session_id, 'exited')
+            return 'exited'
+
+        now = time.monotonic()
+        connected_at = outcome.get('connected_at')
+        if connected_at is not None and now - connected_at >= RETRY_STABLE:
+            attempts = 0
+            failing_since = None
+        attempts += 1
+        if failing_since is None:
+            failing_since = now
+        if now - failing_since > RETRY_WINDOW:
+            write_health(name, session_id, 'gave-up', attempts, error)
+            return 'gave-up'
+
+        write_health(name, session_id, 'reconnecting', attempts, error)
+        time.sleep(backoff_delay(attempts))
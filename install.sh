@@ -31,6 +31,9 @@ echo "Copying scripts..."
 cp "$SCRIPT_DIR/window_color.py" "$TARGET_DIR/"
 cp "$SCRIPT_DIR/typing_monitor.py" "$TARGET_DIR/"
 cp "$SCRIPT_DIR/animate_title.py" "$TARGET_DIR/"
+cp "$SCRIPT_DIR/visual_state.py" "$TARGET_DIR/"
+cp "$SCRIPT_DIR/session_tty.py" "$TARGET_DIR/"
+cp "$SCRIPT_DIR/daemon.py" "$TARGET_DIR/"
 
 # Create virtual environment if it doesn't exist
 if [[ ! -d "$TARGET_DIR/.venv" ]]; then
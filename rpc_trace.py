@@ -0,0 +1,358 @@
+#!/Users/bfeld/.claude/iterm/.venv/bin/python3
+"""
+Records the iTerm2 API traffic of a script and replays it without iTerm2.
+
+Usage: rpc_trace.py record TRACE SCRIPT [ARGS...]
+       rpc_trace.py replay [--speed N] TRACE SCRIPT [ARGS...]
+       rpc_trace.py stats TRACE
+
+record runs SCRIPT against the real iTerm2 and saves every request and
+response with its timing, plus the inputs that pick a script's session
+lookup (session environment variables, controlling tty, ancestor PIDs).
+replay serves that trace from a local socket and restores those inputs, so
+the same script can be re-run (on Linux too) against the exact recorded
+layout; --speed scales the recorded response latency (0 answers
+immediately). Both print the RPC count and latency, so a change can be
+checked against a user's layout. A replayed request that differs from the
+recorded one in anything but its ID counts as a mismatch.
+
+Only the process running SCRIPT is traced: daemons spawned by `start` are
+recorded and replayed by running their `run` command directly.
+
+Trace format (JSON lines):
+  {"inputs": {"env": {...}, "tty": ..., "ancestor_pids": [...]}}   first line
+  {"conn": N, "headers": {...}}                     once per connection
+  {"conn": N, "t": secs, "dir": "send"|"recv", "data": base64 protobuf}
+"""
+import sys
+import os
+import base64
+import json
+import runpy
+import tempfile
+import threading
+import time
+
+# Seconds replay waits for a recorded request before giving up on it
+REPLAY_RECV_TIMEOUT = 5.0
+
+# Response headers replayed with each connection
+RECORDED_HEADERS = ('x-iterm2-protocol-version',)
+
+# Environment variables the scripts resolve their session from
+RECORDED_ENV = ('ITERM_SESSION_ID', 'ANIMATE_TITLE_SESSION_ID', 'TYPING_MONITOR_SESSION_ID')
+
+
+def load_trace(path):
+    """Return (inputs, connections): the recorded inputs (None if not
+    recorded) and (headers, events) per connection, in connection order."""
+    inputs = None
+    connections = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if 'inputs' in record:
+                inputs = record['inputs']
+                continue
+            headers, events = connections.setdefault(record['conn'], ({}, []))
+            if 'headers' in record:
+                headers.update(record['headers'])
+            else:
+                events.append((record['t'], record['dir'],
+                               base64.b64decode(record['data'])))
+    return inputs, [connections[n] for n in sorted(connections)]
+
+
+def capture_inputs():
+    """The inputs a script's session lookup depends on in this process."""
+    import session_tty
+
+    return {
+        'env': {key: os.environ.get(key) for key in RECORDED_ENV},
+        'tty': session_tty.get_controlling_tty(),
+        'ancestor_pids': sorted(session_tty.get_ancestor_pids()),
+    }
+
+
+def inject_inputs(inputs):
+    """Make the script see the recorded inputs instead of this machine's."""
+    import session_tty
+
+    for key, value in inputs['env'].items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+    session_tty.get_controlling_tty = lambda: inputs['tty']
+    session_tty.get_ancestor_pids = lambda: set(inputs['ancestor_pids'])
+
+
+def request_payload(message):
+    """A request without its ID, for comparing recorded and live requests."""
+    from iterm2.api_pb2 import ClientOriginatedMessage
+
+    payload = ClientOriginatedMessage()
+    payload.CopyFrom(message)
+    payload.ClearField('id')
+    return payload
+
+
+def summarize(connections):
+    """Count requests and notifications and sum recorded RPC latency."""
+    from iterm2.api_pb2 import ClientOriginatedMessage, ServerOriginatedMessage
+
+    stats = {'connections': len(connections), 'requests': 0,
+             'notifications': 0, 'latency': 0.0}
+    for _headers, events in connections:
+        sent_at = {}
+        for t, direction, data in events:
+            if direction == 'send':
+                message = ClientOriginatedMessage()
+                message.ParseFromString(data)
+                sent_at[message.id] = t
+                stats['requests'] += 1
+            else:
+                message = ServerOriginatedMessage()
+                message.ParseFromString(data)
+                if message.id in sent_at:
+                    stats['latency'] += t - sent_at.pop(message.id)
+                else:
+                    stats['notifications'] += 1
+    return stats
+
+
+def print_stats(label, stats):
+    line = (f"rpc_trace {label}: {stats['connections']} connections, "
+            f"{stats['requests']} requests, {stats['notifications']} notifications, "
+            f"rpc latency {stats['latency']:.3f}s")
+    if 'mismatches' in stats:
+        line += f", {stats['mismatches']} mismatches"
+    if 'wall' in stats:
+        line += f", wall {stats['wall']:.3f}s"
+    print(line, file=sys.stderr)
+
+
+def add_script_dir(script):
+    """Make SCRIPT's modules (session_tty, ...) importable from here."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+
+
+def run_script(script, args):
+    """Run SCRIPT in this process as if it were started from the shell."""
+    script = os.path.abspath(script)
+    sys.argv = [script] + args
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit:
+        pass
+
+
+class Recorder:
+    """Hooks iterm2.Connection to log every message sent and received."""
+
+    def __init__(self, path, inputs):
+        self.file = open(path, 'w')
+        self.connections = 0
+        self.write({'inputs': inputs})
+
+    def install(self):
+        from iterm2 import connection as conn_module
+
+        Connection = conn_module.Connection
+        recorder = self
+        get_connect_coro = Connection._get_connect_coro
+        async_send_message = Connection.async_send_message
+        get_receiver_future = Connection._get_receiver_future
+
+        def traced_get_connect_coro(connection):
+            connection.trace_id = recorder.connections
+            connection.trace_start = time.monotonic()
+            connection.trace_headers_written = False
+            recorder.connections += 1
+            return get_connect_coro(connection)
+
+        async def traced_async_send_message(connection, message):
+            recorder.log(connection, 'send', message)
+            await async_send_message(connection, message)
+
+        def traced_get_receiver_future(connection, message):
+            recorder.log(connection, 'recv', message)
+            return get_receiver_future(connection, message)
+
+        Connection._get_connect_coro = traced_get_connect_coro
+        Connection.async_send_message = traced_async_send_message
+        Connection._get_receiver_future = traced_get_receiver_future
+
+    def log(self, connection, direction, message):
+        if not connection.trace_headers_written:
+            response_headers = connection.websocket.response_headers
+            headers = {key: response_headers[key]
+                       for key in RECORDED_HEADERS if key in response_headers}
+            self.write({'conn': connection.trace_id, 'headers': headers})
+            connection.trace_headers_written = True
+        self.write({
+            'conn': connection.trace_id,
+            't': round(time.monotonic() - connection.trace_start, 6),
+            'dir': direction,
+            'data': base64.b64encode(message.SerializeToString()).decode(),
+        })
+
+    def write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.file.flush()
+
+
+class ReplayServer:
+    """Serves recorded connections, in order, over a local unix socket.
+
+    Each incoming request is matched against the next recorded one and
+    answered with the recorded responses, with request IDs rewritten to the
+    live ones. Responses wait their recorded latency divided by speed.
+    """
+
+    def __init__(self, connections, speed=1.0):
+        self.connections = connections
+        self.speed = speed
+        self.handshakes = 0
+        self.served = 0
+        self.stats = {'connections': 0, 'requests': 0, 'notifications': 0,
+                      'latency': 0.0, 'mismatches': 0}
+        self.exhausted = threading.Event()
+        self.socket_path = os.path.join(tempfile.mkdtemp(prefix='rpc_trace_'), 'socket')
+        self.ready = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        self.ready.wait()
+
+    def serve_forever(self):
+        import asyncio
+        from websockets.legacy.server import unix_serve
+
+        async def serve():
+            async with unix_serve(self.handle, self.socket_path,
+                                  subprotocols=['api.iterm2.com'],
+                                  extra_headers=self.headers_for_next,
+                                  max_size=None):
+                self.ready.set()
+                await asyncio.Future()
+
+        asyncio.run(serve())
+
+    def headers_for_next(self, _path, _request_headers):
+        index = self.handshakes
+        self.handshakes += 1
+        if index < len(self.connections):
+            return list(self.connections[index][0].items())
+        return []
+
+    async def handle(self, websocket, *_args):
+        import asyncio
+        from iterm2.api_pb2 import ClientOriginatedMessage, ServerOriginatedMessage
+
+        index = self.served
+        self.served += 1
+        if index >= len(self.connections):
+            # Script reconnected after the trace ran out; the replay is over
+            self.exhausted.set()
+            await websocket.close()
+            return
+
+        self.stats['connections'] += 1
+        live_ids = {}
+        received_at = {}
+        last_t = 0.0
+        loop = asyncio.get_running_loop()
+        for t, direction, data in self.connections[index][1]:
+            if direction == 'send':
+                recorded = ClientOriginatedMessage()
+                recorded.ParseFromString(data)
+                try:
+                    raw = await asyncio.wait_for(websocket.recv(), REPLAY_RECV_TIMEOUT)
+                except Exception:
+                    self.stats['mismatches'] += 1
+                    break
+                live = ClientOriginatedMessage()
+                live.ParseFromString(raw)
+                if request_payload(live) != request_payload(recorded):
+                    self.stats['mismatches'] += 1
+                live_ids[recorded.id] = live.id
+                received_at[live.id] = loop.time()
+                self.stats['requests'] += 1
+            else:
+                delay = (t - last_t) / self.speed if self.speed else 0
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                message = ServerOriginatedMessage()
+                message.ParseFromString(data)
+                if message.id in live_ids:
+                    message.id = live_ids.pop(message.id)
+                    self.stats['latency'] += loop.time() - received_at.pop(message.id)
+                else:
+                    self.stats['notifications'] += 1
+                await websocket.send(message.SerializeToString())
+            last_t = t
+        await websocket.close()
+
+    def install(self):
+        """Point iterm2 at this server and skip AppleScript authentication."""
+        from iterm2 import connection as conn_module
+
+        socket_path = self.socket_path
+        conn_module.Connection._unix_domain_socket_path = lambda _self: socket_path
+        conn_module._auth_authenticate = lambda *_args, **_kwargs: False
+
+
+def record(trace, script, args):
+    add_script_dir(script)
+    recorder = Recorder(trace, capture_inputs())
+    recorder.install()
+    run_script(script, args)
+    recorder.file.close()
+    print_stats('recorded', summarize(load_trace(trace)[1]))
+
+
+def replay(trace, script, args, speed):
+    inputs, connections = load_trace(trace)
+    add_script_dir(script)
+    if inputs:
+        inject_inputs(inputs)
+    server = ReplayServer(connections, speed)
+    server.start()
+    server.install()
+
+    def stop_when_exhausted():
+        server.exhausted.wait()
+        import _thread
+        _thread.interrupt_main()
+
+    threading.Thread(target=stop_when_exhausted, daemon=True).start()
+    started = time.monotonic()
+    try:
+        run_script(script, args)
+    except KeyboardInterrupt:
+        pass
+    server.stats['wall'] = time.monotonic() - started
+    print_stats('replayed', server.stats)
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    cmd = argv.pop(0).lower() if argv else ''
+    speed = 1.0
+    if cmd == 'replay' and argv[:1] == ['--speed']:
+        speed = float(argv[1])
+        argv = argv[2:]
+
+    if cmd == 'record' and len(argv) >= 2:
+        record(argv[0], argv[1], argv[2:])
+    elif cmd == 'replay' and len(argv) >= 2:
+        replay(argv[0], argv[1], argv[2:], speed)
+    elif cmd == 'stats' and len(argv) == 1:
+        print_stats('trace', summarize(load_trace(argv[0])[1]))
+    else:
+        print('Usage: rpc_trace.py record TRACE SCRIPT [ARGS...]\n'
+              '       rpc_trace.py replay [--speed N] TRACE SCRIPT [ARGS...]\n'
+              '       rpc_trace.py stats TRACE')
+        sys.exit(1)
@@ -0,0 +1,239 @@
+"""
+Resolve the iTerm session we are running in by its controlling terminal.
+
+Each iTerm session exposes its tty device as the `tty` variable, so one
+variable query per session is enough to find ours - no ancestor PID walk.
+
+Session resolution precedence used by the scripts:
+  1. ITERM_SESSION_ID environment variable (no RPCs)
+  2. Controlling tty matched against each session's `tty` variable
+     (focused session checked first, so usually a single RPC)
+  3. Process tree: ancestor PIDs matched against each session's `pid`
+     (walked in the background: up front where /proc makes it fork-free,
+     otherwise only once the focused session's tty doesn't match)
+  4. The currently focused session
+"""
+import asyncio
+import os
+import subprocess
+import threading
+from concurrent.futures import Future
+
+# Linux pty slaves (/dev/pts/N) use major numbers 136-143
+PTS_MAJORS = range(136, 144)
+
+
+def tty_from_proc(pid):
+    """Return the tty of pid from /proc (Linux), '' if none, None if unknown."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Fields after the command name: state ppid pgrp session tty_nr
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (FileNotFoundError, IndexError):
+        return None
+    tty_nr = int(fields[4])
+    if tty_nr == 0:
+        return ''
+    major = (tty_nr >> 8) & 0xfff
+    minor = (tty_nr & 0xff) | ((tty_nr >> 12) & 0xfff00)
+    if major in PTS_MAJORS:
+        return f'/dev/pts/{(major - PTS_MAJORS[0]) * 256 + minor}'
+    return None
+
+
+def tty_from_ps(pid):
+    """Return the controlling tty of pid using ps (macOS), '' if none."""
+    try:
+        result = subprocess.run(
+            ['ps', '-o', 'tty=', '-p', str(pid)],
+            capture_output=True, text=True
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ''
+    name = result.stdout.strip()
+    if result.returncode != 0 or not name or name.startswith('?'):
+        return ''
+    return name if name.startswith('/') else f'/dev/{name}'
+
+
+def get_ancestor_pids():
+    """Walk up the process tree and return all ancestor PIDs."""
+    pids = set()
+    try:
+        pid = os.getpid()
+        while pid > 1:
+            pids.add(pid)
+            # Get parent PID
+            with open(f'/proc/{pid}/stat', 'r') as f:
+                stat = f.read().split()
+                pid = int(stat[3])  # ppid is 4th field
+    except FileNotFoundError:
+        # macOS doesn't have /proc, use subprocess
+        pid = os.getpid()
+        while pid > 1:
+            pids.add(pid)
+            try:
+                result = subprocess.run(
+                    ['ps', '-o', 'ppid=', '-p', str(pid)],
+                    capture_output=True, text=True
+                )
+                if result.returncode != 0:
+                    break
+                pid = int(result.stdout.strip())
+            except (ValueError, subprocess.SubprocessError):
+                break
+    return pids
+
+
+def ancestors_fork_free():
+    """Whether get_ancestor_pids() can read /proc instead of running ps."""
+    return os.path.exists(f'/proc/{os.getpid()}/stat')
+
+
+def get_controlling_tty():
+    """Return our terminal device path (e.g. /dev/ttys003), or None.
+
+    Tries stdin, stderr and stdout first. Hooks usually get pipes there, so
+    then falls back to the controlling terminal of this process, which the
+    hook inherits from Claude Code: read from /proc without forking where
+    available, otherwise with a single ps call.
+    """
+    for fd in (0, 2, 1):
+        try:
+            return os.ttyname(fd)
+        except OSError:
+            continue
+
+    tty = tty_from_proc(os.getpid())
+    if tty is None:
+        tty = tty_from_ps(os.getpid())
+    return tty or None
+
+
+def focused_session(app):
+    """The session in the focused tab of the current window, or None."""
+    window = app.current_window
+    if window and window.current_tab:
+        return window.current_tab.current_session
+    return None
+
+
+async def find_session_by_tty(app, tty, on_miss=None):
+    """Find the iTerm session whose `tty` variable is exactly tty.
+
+    on_miss is called when the focused session doesn't match, before the
+    other sessions are scanned.
+    """
+    if not tty:
+        return None
+
+    # Fast path: hooks almost always fire in the focused session
+    current = focused_session(app)
+    if current:
+        try:
+            if await current.async_get_variable('tty') == tty:
+                return current
+        except Exception:
+            pass
+    if on_miss:
+        on_miss()
+
+    for window in app.terminal_windows:
+        for tab in window.tabs:
+            for session in tab.sessions:
+                if session is current:
+                    continue
+                try:
+                    if await session.async_get_variable('tty') == tty:
+                        return session
+                except Exception:
+                    continue
+    return None
+
+
+async def find_session_by_pids(app, pids):
+    """Find the iTerm session whose shell `pid` is one of pids."""
+    for window in app.terminal_windows:
+        for tab in window.tabs:
+            for session in tab.sessions:
+                try:
+                    session_pid = await session.async_get_variable('pid')
+                    if session_pid and int(session_pid) in pids:
+                        return session
+                except Exception:
+                    continue
+    return None
+
+
+async def find_session(app, resolution=None, focused=True):
+    """Find the session we are running in, by the precedence above.
+
+    resolution is a start_resolution() result; without one the tty is
+    looked up now. With focused=False, None is returned instead of falling
+    back to the focused session.
+    """
+    session_id = os.environ.get('ITERM_SESSION_ID', '')
+    if session_id:
+        # Format: w0t0p0:actual-session-id
+        session = app.get_session_by_id(session_id.split(':', 1)[-1])
+        if session:
+            return session
+
+    resolution = resolution or {}
+    ancestors = resolution.get('ancestors')
+
+    def walk_ancestors():
+        # Overlaps the scan of the other sessions' ttys
+        nonlocal ancestors
+        if ancestors is None:
+            ancestors = in_background(get_ancestor_pids)
+
+    tty = await resolved(resolution.get('tty'), get_controlling_tty)
+    session = await find_session_by_tty(app, tty, on_miss=walk_ancestors)
+    if not session:
+        session = await find_session_by_pids(app, await resolved(ancestors, get_ancestor_pids))
+    if not session and focused:
+        session = focused_session(app)
+    return session
+
+
+def in_background(func):
+    """Run func in a daemon thread and return a Future for its result.
+
+    Daemon threads don't hold up interpreter exit when the result turns
+    out not to be needed.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func())
+        except Exception as err:
+            future.set_exception(err)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def start_resolution():
+    """Start resolving our controlling tty in a background thread.
+
+    Called before connecting, so the lookup overlaps the connection
+    handshake and layout fetch. Returns the lookups for find_session(), or
+    None when ITERM_SESSION_ID makes them unnecessary. The ancestor walk
+    only starts here when it is fork-free; with ps it waits until the tty
+    misses the focused session.
+    """
+    if os.environ.get('ITERM_SESSION_ID'):
+        return None
+    return {
+        'tty': in_background(get_controlling_tty),
+        'ancestors': in_background(get_ancestor_pids) if ancestors_fork_free() else None,
+    }
+
+
+async def resolved(future, fallback):
+    """Await a background lookup, or compute it now if it wasn't started."""
+    if future is None:
+        return fallback()
+    return await asyncio.wrap_future(future)
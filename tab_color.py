@@ -9,48 +9,14 @@ Use 'clear' to reset when you start typing.
 """
 import iterm2
 import sys
-import os
-import subprocess
-
-
-def get_ancestor_pids():
-    """Walk up the process tree and return all ancestor PIDs."""
-    pids = set()
-    pid = os.getpid()
-    while pid > 1:
-        pids.add(pid)
-        try:
-            result = subprocess.run(
-                ['ps', '-o', 'ppid=', '-p', str(pid)],
-                capture_output=True, text=True
-            )
-            if result.returncode != 0:
-                break
-            pid = int(result.stdout.strip())
-        except (ValueError, subprocess.SubprocessError):
-            break
-    return pids
-
-
-async def find_session_by_process_tree(app):
-    """Find the iTerm session that is an ancestor of our process."""
-    ancestor_pids = get_ancestor_pids()
-
-    for window in app.terminal_windows:
-        for tab in window.tabs:
-            for session in tab.sessions:
-                try:
-                    session_pid = await session.async_get_variable('pid')
-                    if session_pid and int(session_pid) in ancestor_pids:
-                        return session
-                except Exception:
-                    continue
-    return None
+
+import session_tty
+import visual_state
 
 
 # Tab colors
 TAB_COLORS = {
-    "white": (255, 255, 255),   # White title bar (inverted - attention!)
+    "white": visual_state.STATES["done"]["tab_color"],  # White title bar (attention!)
     "light": (220, 220, 220),   # Light gray
     "dark": (30, 30, 40),       # Dark blue-gray (subtle)
     "blue": (20, 40, 80),       # Dark blue
@@ -58,7 +24,13 @@ TAB_COLORS = {
     "green": (20, 50, 30),      # Dark green
     "red": (60, 20, 20),        # Dark red
     "orange": (70, 40, 10),     # Dark orange
-    "clear": None,              # Remove tab color (reset to default)
+    "clear": visual_state.STATES["acknowledged"]["tab_color"],  # No tab color
+}
+
+# Colors that correspond to a visual state (see visual_state.py)
+COLOR_STATES = {
+    "white": "done",
+    "clear": "acknowledged",
 }
 
 
@@ -68,27 +40,22 @@ async def main(connection):
     # Get color argument (default to "dark")
     color_name = sys.argv[1].lower() if len(sys.argv) > 1 else "dark"
 
-    # Find the session (tab color is set via session's profile)
-    session_id = os.environ.get('ITERM_SESSION_ID')
-    if session_id and ':' in session_id:
-        session_id = session_id.split(':', 1)[1]
-        session = app.get_session_by_id(session_id)
-    else:
-        session = await find_session_by_process_tree(app)
-
+    # Find the session (tab color is set via session's profile); falls
+    # back to the focused session
+    session = await session_tty.find_session(app, RESOLUTION)
     if not session:
-        # Fallback to current session
-        window = app.current_window
-        if window and window.current_tab:
-            session = window.current_tab.current_session
+        return
 
-    if not session:
+    if color_name in COLOR_STATES:
+        # Only sends what differs from the session's current state
+        await visual_state.async_transition(session, COLOR_STATES[color_name],
+                                            visual_state.TAB_PROPERTIES)
         return
 
     # Get the session's profile
     profile = await session.async_get_profile()
 
-    if color_name == "clear" or color_name not in TAB_COLORS:
+    if color_name not in TAB_COLORS:
         # Disable tab color (reset to default)
         await profile.async_set_use_tab_color(False)
         await profile.async_set_use_tab_color_dark(False)
@@ -102,5 +69,9 @@ async def main(connection):
         await profile.async_set_tab_color(color)
         await profile.async_set_tab_color_dark(color)
 
+    # Tab color no longer matches a known state; next transition writes it
+    visual_state.forget_state(session.session_id, visual_state.TAB_PROPERTIES)
+
 
+RESOLUTION = session_tty.start_resolution()
 iterm2.run_until_complete(main)
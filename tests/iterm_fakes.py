@@ -0,0 +1,200 @@
+"""
+Fake iTerm2 objects for running the daemons without iTerm2.
+
+FakeITerm patches the iterm2 module so daemon.run() "connects" to a fake
+connection and the daemon sees a fake app, session and focus/termination
+monitors. A test drives it from inside the event loop with a driver
+coroutine, and can hook every session name write.
+"""
+import asyncio
+import signal
+import weakref
+from types import SimpleNamespace
+
+import iterm2
+import iterm2.notifications
+import iterm2.rpc
+
+
+class FakeSession:
+    def __init__(self, session_id, name='orig'):
+        self.session_id = session_id
+        self.name = name
+        self.writes = 0
+        # Awaited after every name write, so a test can act mid-write
+        self.on_set_name = None
+
+    async def async_set_name(self, name):
+        self.name = name
+        self.writes += 1
+        if self.on_set_name:
+            await self.on_set_name(self, name)
+
+
+class FakeTab:
+    def __init__(self, tab_id, sessions):
+        self.tab_id = tab_id
+        self.sessions = sessions
+        self.current_session = sessions[0]
+
+
+class FakeWindow:
+    def __init__(self, tabs, current=0):
+        self.tabs = tabs
+        self.current_tab = tabs[current]
+
+
+class FakeApp:
+    def __init__(self, windows):
+        self.terminal_windows = windows
+        self.current_window = windows[0]
+        self.app_active = True
+        self.tokens = ['layout', 'focus', 'sessions']
+
+    def sessions(self):
+        return [(window, tab, session) for window in self.terminal_windows
+                for tab in window.tabs for session in tab.sessions]
+
+    def get_session_by_id(self, session_id):
+        for _window, _tab, session in self.sessions():
+            if session.session_id == session_id:
+                return session
+        return None
+
+    def get_window_and_tab_for_session(self, target):
+        for window, tab, session in self.sessions():
+            if session is target:
+                return window, tab
+        return None, None
+
+
+class FakeConnection:
+    def __init__(self, fake):
+        self.fake = fake
+        self.loop = None  # asyncio.run() closes its own loop
+        self.websocket = SimpleNamespace(wait_closed=lambda: asyncio.Future())
+
+    def run_until_complete(self, coro, _retry):
+        async def connected():
+            driver = asyncio.ensure_future(self.fake.driver(self.fake))
+            try:
+                return await coro(self)
+            finally:
+                driver.cancel()
+
+        return asyncio.run(connected())
+
+
+class FakeITerm:
+    """Patches iterm2 so daemons run against app; call undo() when done."""
+
+    def __init__(self, app):
+        # Handed to the first async_get_app; from then on only iterm2's
+        # App.instance holds it, so app_ref shows whether it was released
+        self.unclaimed_app = app
+        self.app_ref = weakref.ref(app)
+        self.focus_updates = None
+        self.terminations = None
+        self.unsubscribed = []
+        self.list_sessions_calls = 0
+        self.patched = []
+        fake = self
+
+        async def driver(_fake):
+            await asyncio.Future()
+
+        self.driver = driver
+
+        async def async_get_app(_connection):
+            if iterm2.app.App.instance is None:
+                iterm2.app.App.instance = fake.unclaimed_app or fake.app_ref()
+                fake.unclaimed_app = None
+            return iterm2.app.App.instance
+
+        async def async_unsubscribe(_connection, token):
+            fake.unsubscribed.append(token)
+
+        async def async_list_sessions(_connection):
+            fake.list_sessions_calls += 1
+            app = fake.app_ref()
+            windows = [SimpleNamespace(tabs=[SimpleNamespace(tab_id=tab.tab_id)
+                                             for tab in window.tabs])
+                       for window in app.terminal_windows]
+            return SimpleNamespace(list_sessions_response=SimpleNamespace(windows=windows))
+
+        class FocusMonitor:
+            def __init__(self, _connection):
+                pass
+
+            async def __aenter__(self):
+                fake.focus_updates = asyncio.Queue()
+                return self
+
+            async def __aexit__(self, *_args):
+                pass
+
+            async def async_get_next_update(self):
+                return await fake.focus_updates.get()
+
+        class SessionTerminationMonitor:
+            def __init__(self, _connection):
+                pass
+
+            async def __aenter__(self):
+                fake.terminations = asyncio.Queue()
+                return self
+
+            async def __aexit__(self, *_args):
+                pass
+
+            async def async_get(self):
+                return await fake.terminations.get()
+
+        self.patch(iterm2, 'Connection', lambda: FakeConnection(fake))
+        self.patch(iterm2, 'async_get_app', async_get_app)
+        self.patch(iterm2, 'FocusMonitor', FocusMonitor)
+        self.patch(iterm2, 'SessionTerminationMonitor', SessionTerminationMonitor)
+        self.patch(iterm2.notifications, 'async_unsubscribe', async_unsubscribe)
+        self.patch(iterm2.rpc, 'async_list_sessions', async_list_sessions)
+        self.patch(iterm2.app.App, 'instance', None)
+        for cls in (iterm2.Session, iterm2.Tab, iterm2.Window):
+            self.patch(cls, 'delegate', getattr(cls, 'delegate', None))
+        # The animation daemon blocks its stop/burst signals
+        self.signal_mask = signal.pthread_sigmask(signal.SIG_BLOCK, [])
+
+    def patch(self, obj, name, value):
+        self.patched.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    def undo(self):
+        for obj, name, value in reversed(self.patched):
+            setattr(obj, name, value)
+        # Discard stop/burst signals still pending, then restore the mask
+        handlers = {sig: signal.signal(sig, signal.SIG_IGN)
+                    for sig in (signal.SIGTERM, signal.SIGUSR1)}
+        signal.pthread_sigmask(signal.SIG_SETMASK, self.signal_mask)
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+
+    def focus(self, tab_id=None, app_active=None):
+        """Queue a focus update, as FocusMonitor would report it."""
+        self.focus_updates.put_nowait(SimpleNamespace(
+            application_active=(SimpleNamespace(application_active=app_active)
+                                if app_active is not None else None),
+            selected_tab_changed=SimpleNamespace(tab_id=tab_id) if tab_id else None,
+        ))
+
+    def terminate(self, session_id):
+        self.terminations.put_nowait(session_id)
+
+
+def make_app(session_id, selected=True):
+    """Our session alone in tab T1, next to tab T2 in the same window.
+
+    With selected=False, T2 is the selected tab, so our session is hidden.
+    """
+    ours = FakeSession(session_id)
+    other = FakeSession(f'{session_id}-other', 'other')
+    window = FakeWindow([FakeTab('T1', [ours]), FakeTab('T2', [other])],
+                        current=0 if selected else 1)
+    return FakeApp([window]), ours
@@ -0,0 +1,98 @@
+"""The animation daemon's loop, run against fake iTerm2 objects."""
+import asyncio
+import json
+import os
+import signal
+import time
+
+import pytest
+
+import animate_title
+import daemon
+from iterm_fakes import FakeITerm, make_app
+
+SESSION_ID = 'w0t0p0:LOOP-TEST'
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    """Keep the daemon's per-session files in tmp_path."""
+    for getter in ('get_pid_file', 'get_title_file', 'get_stats_file'):
+        path = str(tmp_path / getter)
+        monkeypatch.setattr(animate_title, getter, lambda _sid=None, path=path: path)
+    monkeypatch.setattr(daemon, 'get_health_file',
+                        lambda *_args: str(tmp_path / 'health'))
+    monkeypatch.setenv('ANIMATE_TITLE_SESSION_ID', SESSION_ID)
+    with open(animate_title.get_pid_file(), 'w') as f:
+        f.write(f'{os.getpid()} run')
+    return tmp_path
+
+
+@pytest.fixture
+def hidden():
+    """Fakes with our session's tab not selected: frames every 2 s."""
+    app, session = make_app(SESSION_ID, selected=False)
+    fake = FakeITerm(app)
+    yield fake, session
+    fake.undo()
+
+
+def record_writes(session, actions):
+    """Record (time, name) of every name write.
+
+    actions maps a write's number (1-based) to a callable run mid-write.
+    """
+    writes = []
+
+    async def on_set_name(_session, name):
+        writes.append((time.monotonic(), name))
+        action = actions.get(len(writes))
+        if action:
+            # The monitors subscribe meanwhile; the loop then handles the
+            # action while the write is still in flight
+            await asyncio.sleep(0.05)
+            action()
+            await asyncio.sleep(0.05)
+
+    session.on_set_name = on_set_name
+    return writes
+
+
+@pytest.mark.parametrize('mode', ['stop', 'burst'])
+def test_signal_during_frame_write_exits_at_once(files, hidden, mode):
+    fake, session = hidden
+    sig = animate_title.DAEMON_SIGNALS[mode]
+    writes = record_writes(session, {1: lambda: os.kill(os.getpid(), sig)})
+
+    assert animate_title.run_animation() is None
+
+    # Restoring starts at once, not after the 2 s hidden wait
+    assert writes[1][0] - writes[0][0] < animate_title.HIDDEN_REFRESH_RATE / 4
+    names = [name for _, name in writes]
+    assert names[-1] == 'orig'
+    if mode == 'burst':
+        assert len(names) == 1 + len(animate_title.FIRE_BURST) + 1
+    else:
+        assert len(names) == 2
+    assert not os.path.exists(animate_title.get_pid_file())
+    assert not os.path.exists(animate_title.get_title_file())
+
+
+def test_focus_during_hidden_frame_write_resumes_at_once(files, hidden):
+    fake, session = hidden
+    writes = record_writes(session, {
+        1: lambda: fake.focus(tab_id='T1'),  # Our tab gets selected
+        4: lambda: fake.terminate(SESSION_ID),
+    })
+
+    assert animate_title.run_animation() is None
+    assert daemon.read_health('animation', SESSION_ID)['status'] == 'session-gone'
+
+    # Full-rate frames right away, not after the 2 s hidden wait
+    times = [at for at, _ in writes]
+    assert len(times) == 4
+    assert times[1] - times[0] < animate_title.REFRESH_RATE * 2
+    for earlier, later in zip(times[1:], times[2:]):
+        assert later - earlier < animate_title.REFRESH_RATE * 2
+    with open(animate_title.get_stats_file()) as f:
+        assert json.load(f)['visible'] is True
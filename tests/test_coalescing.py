@@ -0,0 +1,72 @@
+"""Per-session command coalescing in animate_title.submit (no iTerm needed)."""
+import os
+import threading
+import time
+
+import pytest
+
+import animate_title
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """A fresh session whose workers are recorded instead of spawned."""
+    session_id = f'TEST-{os.getpid()}-{time.monotonic_ns()}'
+    monkeypatch.setenv('ITERM_SESSION_ID', f'w0t0p0:{session_id}')
+    spawned = []
+
+    def fake_spawn(sid, mode):
+        spawned.append(mode)
+        # Record a live PID so the next command has a worker to replace
+        with open(animate_title.get_pid_file(sid), 'w') as f:
+            f.write(f'{os.getpid()} {mode}-fake')
+
+    def fake_stop(sid=None):
+        # The recorded PID is ours; forget it instead of signalling it
+        if os.path.exists(animate_title.get_pid_file(sid)):
+            os.remove(animate_title.get_pid_file(sid))
+
+    monkeypatch.setattr(animate_title, 'spawn_worker', fake_spawn)
+    monkeypatch.setattr(animate_title, 'stop_process', fake_stop)
+    # Wide enough that thread start-up jitter can't reorder commands
+    monkeypatch.setattr(animate_title, 'COALESCE_WINDOW', 0.2)
+    yield session_id, spawned
+    for path in (animate_title.get_pid_file(session_id),
+                 animate_title.get_queue_file(session_id),
+                 animate_title.get_title_file(session_id)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def submit_overlapping(commands, stagger):
+    threads = []
+    for cmd in commands:
+        thread = threading.Thread(target=animate_title.submit, args=(cmd,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(stagger)
+    for thread in threads:
+        thread.join()
+
+
+def test_overlapping_commands_apply_only_the_last(session):
+    session_id, spawned = session
+    submit_overlapping(['start', 'stop', 'start'], 0.02)
+    assert spawned == ['run']
+    pid, mode = animate_title.read_pid_file(session_id)
+    assert pid == os.getpid() and mode == 'run-fake'
+
+
+def test_overlapping_stop_wins(session):
+    session_id, spawned = session
+    with open(animate_title.get_title_file(session_id), 'w') as f:
+        f.write('orig')
+    submit_overlapping(['start', 'start', 'stop'], 0.02)
+    assert spawned == ['restore']
+
+
+def test_separate_commands_each_apply(session):
+    _session_id, spawned = session
+    submit_overlapping(['start', 'start'], 0.5)
+    # The second start replaced the first worker: still one recorded
+    assert spawned == ['run', 'run']
@@ -0,0 +1,66 @@
+"""daemon.run() reconnect policy against a socket that refuses connections."""
+import json
+import os
+import socket
+
+import pytest
+from iterm2 import connection as conn_module
+
+import daemon
+
+
+@pytest.fixture
+def refused_socket(tmp_path, monkeypatch):
+    """Point iterm2 at a unix socket nobody listens on."""
+    path = str(tmp_path / 'socket')
+    sock = socket.socket(socket.AF_UNIX)
+    sock.bind(path)  # Bound but not listening: connect() is refused
+    monkeypatch.setattr(conn_module.Connection, '_unix_domain_socket_path',
+                        lambda _self: path)
+    monkeypatch.setattr(conn_module, '_auth_authenticate', lambda *_args, **_kwargs: False)
+    yield path
+    sock.close()
+
+
+def test_refused_connection_backs_off_then_gives_up(refused_socket, tmp_path, monkeypatch):
+    health_file = tmp_path / 'health'
+    monkeypatch.setattr(daemon, 'get_health_file', lambda *_args: str(health_file))
+    monkeypatch.setattr(daemon, 'RETRY_BASE', 0.01)
+    monkeypatch.setattr(daemon, 'RETRY_CAP', 0.04)
+    monkeypatch.setattr(daemon, 'RETRY_WINDOW', 0.3)
+
+    delays = []
+    backoff_delay = daemon.backoff_delay
+
+    def recorded_delay(attempt):
+        delays.append((attempt, backoff_delay(attempt)))
+        return delays[-1][1]
+
+    monkeypatch.setattr(daemon, 'backoff_delay', recorded_delay)
+    statuses = []
+    write_health = daemon.write_health
+    monkeypatch.setattr(daemon, 'write_health',
+                        lambda *args, **kwargs: (statuses.append(args[2]),
+                                                 write_health(*args, **kwargs)))
+
+    async def main(_connection):
+        raise AssertionError('never connects')
+
+    fds = len(os.listdir('/proc/self/fd'))
+    assert daemon.run(main, 'test', 'S1') == 'gave-up'
+    # Every attempt's event loop was closed again
+    assert len(os.listdir('/proc/self/fd')) == fds
+
+    # Every failed attempt backed off, with exponentially growing delays
+    assert len(delays) >= 3
+    assert [attempt for attempt, _ in delays] == list(range(1, len(delays) + 1))
+    for attempt, delay in delays:
+        full = min(daemon.RETRY_CAP, daemon.RETRY_BASE * 2 ** (attempt - 1))
+        assert full * 0.5 <= delay <= full
+    assert statuses == ['reconnecting'] * len(delays) + ['gave-up']
+
+    record = json.loads(health_file.read_text())
+    assert record['status'] == 'gave-up'
+    assert record['pid'] == os.getpid()
+    assert record['attempts'] == len(delays) + 1
+    assert 'ConnectionRefusedError' in record['last_error']
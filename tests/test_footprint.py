@@ -0,0 +1,88 @@
+"""Daemon memory footprint against daemon.RSS_BUDGET_MB."""
+import json
+import os
+import subprocess
+import sys
+
+import daemon
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(TESTS)
+
+# Runs the animation daemon against fake iTerm2 objects in a fresh
+# interpreter, so its RSS is the daemon's alone, and prints what it saw
+# after FRAMES frames.
+LOOP_SCRIPT = """
+import asyncio, gc, json, sys
+import animate_title, daemon
+from iterm_fakes import FakeITerm, make_app
+
+tmp, frames = sys.argv[1], int(sys.argv[2])
+for getter in ('get_pid_file', 'get_title_file', 'get_stats_file'):
+    setattr(animate_title, getter, lambda _sid=None, getter=getter: f'{tmp}/{getter}')
+daemon.get_health_file = lambda *_args: f'{tmp}/health'
+animate_title.REFRESH_RATE = 0.001
+daemon.FOOTPRINT_INTERVAL = 0.5
+
+app, session = make_app('S1')
+fake = FakeITerm(app)
+del app
+
+async def driver(fake):
+    while session.writes < frames:
+        await asyncio.sleep(0.05)
+    gc.collect()
+    print(json.dumps({'health': daemon.read_health('animation', 'S1'),
+                      'app_released': fake.app_ref() is None,
+                      'unsubscribed': fake.unsubscribed}))
+    fake.terminate('S1')
+
+fake.driver = driver
+animate_title.run_animation()
+"""
+
+
+def run_loop(tmp_path, frames):
+    env = dict(os.environ, ANIMATE_TITLE_SESSION_ID='S1',
+               PYTHONPATH=os.pathsep.join([REPO, TESTS]))
+    result = subprocess.run([sys.executable, '-c', LOOP_SCRIPT, str(tmp_path), str(frames)],
+                            cwd=REPO, env=env, capture_output=True, text=True,
+                            check=True, timeout=60)
+    return json.loads(result.stdout)
+
+
+def test_animation_loop_fits_budget(tmp_path):
+    seen = run_loop(tmp_path, 2000)
+    health = seen['health']
+    assert health['status'] == 'connected'
+    assert 0 < health['rss_kb'] <= daemon.RSS_BUDGET_MB * 1024
+    # Frames allocate nothing they keep; the residue is per check, not per frame
+    assert abs(health['blocks_per_frame']) < 0.5
+    # The app model is dropped once visibility tracking has what it needs
+    assert seen['app_released']
+    assert seen['unsubscribed'] == ['layout', 'focus', 'sessions']
+
+
+def test_current_rss_drops_after_release():
+    before = daemon.current_rss_kb()
+    block = b'x' * (64 * 1024 * 1024)
+    grown = daemon.current_rss_kb()
+    del block
+    released = daemon.current_rss_kb()
+    assert grown - before >= 60 * 1024
+    # A peak measure (ru_maxrss) would stay at grown
+    assert grown - released >= 60 * 1024
+
+
+def test_check_records_footprint(tmp_path, monkeypatch):
+    health_file = tmp_path / 'health'
+    monkeypatch.setattr(daemon, 'get_health_file', lambda *_args: str(health_file))
+    footprint = daemon.Footprint('test', 'S1')
+    for _ in range(10):
+        footprint.frame()
+    footprint.check(force=True)
+    record = json.loads(health_file.read_text())
+    assert record['status'] == 'connected'
+    assert record['rss_kb'] > 0
+    assert record['rss_budget_kb'] == daemon.RSS_BUDGET_MB * 1024
+    assert 'blocks_per_frame' in record
@@ -0,0 +1,42 @@
+"""Replaying a checked-in trace against a script (no iTerm needed)."""
+import glob
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(TESTS)
+
+# window_color.py white, recorded in REPLAY-S2 (/dev/ttys002): the second
+# of two tabs, so the tty scan passes over the focused REPLAY-S1 first
+TRACE = os.path.join(TESTS, 'data', 'window_color_white.trace')
+
+
+@pytest.fixture
+def no_visual_state():
+    """The recorded requests assume the session's state is unknown."""
+    def clear():
+        for path in glob.glob('/tmp/iterm_visual_state_REPLAY-S*'):
+            os.remove(path)
+
+    clear()
+    yield
+    clear()
+
+
+def replay(script, *args):
+    result = subprocess.run(
+        [sys.executable, 'rpc_trace.py', 'replay', '--speed', '0', TRACE, script, *args],
+        cwd=REPO, capture_output=True, text=True, timeout=60)
+    stats = re.search(r'rpc_trace replayed: .*', result.stderr)
+    assert stats, result.stderr
+    return {name: int(count) for count, name in
+            re.findall(r'(\d+) (connections|requests|mismatches)', stats.group())}
+
+
+def test_window_color_replays_without_mismatches(no_visual_state):
+    stats = replay('window_color.py', 'white')
+    assert stats == {'connections': 1, 'requests': 17, 'mismatches': 0}
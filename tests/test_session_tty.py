@@ -0,0 +1,185 @@
+"""Session resolution by controlling tty (no iTerm needed)."""
+import asyncio
+import os
+import pty
+import threading
+
+import pytest
+
+import session_tty
+
+
+class FakeSession:
+    def __init__(self, tty, pid=None):
+        self.tty = tty
+        self.pid = pid
+        self.session_id = f'session-{tty}'
+        self.queries = 0
+
+    async def async_get_variable(self, name):
+        self.queries += 1
+        return getattr(self, name)
+
+
+class FakeTab:
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.current_session = sessions[0]
+
+
+class FakeWindow:
+    def __init__(self, tabs):
+        self.tabs = tabs
+        self.current_tab = tabs[0]
+
+
+class FakeApp:
+    def __init__(self, windows):
+        self.terminal_windows = windows
+        self.current_window = windows[0]
+
+    def get_session_by_id(self, session_id):
+        for session in all_sessions(self):
+            if session.session_id == session_id:
+                return session
+        return None
+
+
+def make_app(ttys_per_tab):
+    """One window per list of tabs; the first session of each is current."""
+    windows = [FakeWindow([FakeTab([FakeSession(tty) for tty in tab]) for tab in tabs])
+               for tabs in ttys_per_tab]
+    return FakeApp(windows)
+
+
+def all_sessions(app):
+    return [session for window in app.terminal_windows
+            for tab in window.tabs for session in tab.sessions]
+
+
+def total_queries(app):
+    return sum(session.queries for session in all_sessions(app))
+
+
+def test_focused_session_takes_one_rpc():
+    app = make_app([[['/dev/ttys001', '/dev/ttys002'], ['/dev/ttys003']],
+                    [['/dev/ttys004']]])
+    session = asyncio.run(session_tty.find_session_by_tty(app, '/dev/ttys001'))
+    assert session is app.current_window.current_tab.current_session
+    assert total_queries(app) == 1
+
+
+def test_other_session_skips_focused_in_scan():
+    app = make_app([[['/dev/ttys001', '/dev/ttys002']], [['/dev/ttys003']]])
+    session = asyncio.run(session_tty.find_session_by_tty(app, '/dev/ttys003'))
+    assert session.tty == '/dev/ttys003'
+    assert app.current_window.current_tab.current_session.queries == 1
+    assert total_queries(app) == 3
+
+
+def test_no_tty_queries_nothing():
+    app = make_app([[['/dev/ttys001']]])
+    assert asyncio.run(session_tty.find_session_by_tty(app, None)) is None
+    assert total_queries(app) == 0
+
+
+def test_no_match():
+    app = make_app([[['/dev/ttys001']]])
+    assert asyncio.run(session_tty.find_session_by_tty(app, '/dev/ttys009')) is None
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/stat'), reason='needs /proc')
+def test_controlling_tty_with_piped_stdio_does_not_fork():
+    """Hooks get pipes on stdio; the tty comes from /proc, not from ps."""
+    result_read, result_write = os.pipe()
+    pid, master = pty.fork()
+    if pid == 0:
+        status = 1
+        try:
+            expected = os.ttyname(0)
+            # Replace stdio with pipes, as Claude Code does for hooks
+            for fd in (0, 1, 2):
+                read_end, write_end = os.pipe()
+                os.dup2(read_end if fd == 0 else write_end, fd)
+
+            forks = []
+            session_tty.subprocess.run = lambda *args, **kwargs: forks.append(args)
+            tty = session_tty.get_controlling_tty()
+            os.write(result_write, f'{expected} {tty} {len(forks)}'.encode())
+            status = 0
+        finally:
+            os._exit(status)
+
+    os.close(result_write)
+    try:
+        output = os.read(result_read, 1024).decode()
+    finally:
+        os.close(result_read)
+        os.waitpid(pid, 0)
+        os.close(master)
+    expected, tty, forks = output.split()
+    assert tty.startswith('/dev/pts/')
+    assert tty == expected
+    assert forks == '0'
+
+
+def test_start_resolution_walks_ancestors_when_fork_free(monkeypatch):
+    monkeypatch.delenv('ITERM_SESSION_ID', raising=False)
+    monkeypatch.setattr(session_tty, 'ancestors_fork_free', lambda: True)
+    monkeypatch.setattr(session_tty, 'get_ancestor_pids', lambda: {1, 4242})
+    resolution = session_tty.start_resolution()
+    tty = asyncio.run(session_tty.resolved(resolution['tty'], lambda: 'unused'))
+    assert tty == session_tty.get_controlling_tty()
+    assert resolution['ancestors'].result(timeout=5) == {1, 4242}
+
+
+def test_start_resolution_leaves_ps_walk_for_a_miss(monkeypatch):
+    monkeypatch.delenv('ITERM_SESSION_ID', raising=False)
+    monkeypatch.setattr(session_tty, 'ancestors_fork_free', lambda: False)
+    resolution = session_tty.start_resolution()
+    assert resolution['ancestors'] is None
+
+
+def test_start_resolution_skipped_with_session_id(monkeypatch):
+    monkeypatch.setenv('ITERM_SESSION_ID', 'w0t0p0:S1')
+    assert session_tty.start_resolution() is None
+
+
+def find(app, tty, focused=True):
+    resolution = {'tty': session_tty.in_background(lambda: tty), 'ancestors': None}
+    return asyncio.run(session_tty.find_session(app, resolution, focused))
+
+
+def test_find_session_prefers_iterm_session_id(monkeypatch):
+    app = make_app([[['/dev/ttys001'], ['/dev/ttys002']]])
+    monkeypatch.setenv('ITERM_SESSION_ID', 'w0t1p0:session-/dev/ttys002')
+    assert find(app, '/dev/ttys001').tty == '/dev/ttys002'
+    assert total_queries(app) == 0
+
+
+def test_find_session_falls_back_to_process_tree(monkeypatch):
+    monkeypatch.delenv('ITERM_SESSION_ID', raising=False)
+    app = make_app([[['/dev/ttys001'], ['/dev/ttys002']]])
+    all_sessions(app)[1].pid = 4242
+    monkeypatch.setattr(session_tty, 'get_ancestor_pids', lambda: {1, 4242})
+    assert find(app, '/dev/ttys009').tty == '/dev/ttys002'
+
+
+def test_find_session_walks_ancestors_only_after_focused_miss(monkeypatch):
+    monkeypatch.delenv('ITERM_SESSION_ID', raising=False)
+    walked = threading.Event()
+    monkeypatch.setattr(session_tty, 'get_ancestor_pids', lambda: walked.set() or set())
+    app = make_app([[['/dev/ttys001'], ['/dev/ttys002']]])
+    assert find(app, '/dev/ttys001').tty == '/dev/ttys001'
+    assert not walked.wait(0.1)
+    # Started while the other sessions are scanned, even if they match
+    assert find(app, '/dev/ttys002').tty == '/dev/ttys002'
+    assert walked.wait(5)
+
+
+def test_find_session_focused_fallback(monkeypatch):
+    monkeypatch.delenv('ITERM_SESSION_ID', raising=False)
+    monkeypatch.setattr(session_tty, 'get_ancestor_pids', lambda: set())
+    app = make_app([[['/dev/ttys001'], ['/dev/ttys002']]])
+    assert find(app, None) is app.current_window.current_tab.current_session
+    assert find(app, None, focused=False) is None
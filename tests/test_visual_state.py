@@ -0,0 +1,94 @@
+"""Write plans for visual state transitions (no iTerm needed)."""
+import visual_state
+from visual_state import compile_plans, get_plan, MISSING
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+
+
+def setters(plan):
+    return [setter for setter, _value in plan]
+
+
+def test_same_state_writes_nothing():
+    for state in visual_state.STATES:
+        assert get_plan(state, state) == ()
+
+
+def test_unknown_state_writes_every_property_it_sets():
+    plan = get_plan(None, 'done')
+    assert setters(plan) == [
+        'set_background_color', 'set_background_color_dark',
+        'set_foreground_color', 'set_foreground_color_dark',
+        'set_bold_color', 'set_bold_color_dark',
+        'set_use_tab_color', 'set_use_tab_color_dark',
+        'set_tab_color', 'set_tab_color_dark',
+    ]
+
+
+def test_unrecognized_state_is_treated_as_unknown():
+    assert get_plan('no-such-state', 'done') == get_plan(None, 'done')
+
+
+def test_done_to_acknowledged_flips_colors_and_clears_tab():
+    plan = dict(get_plan('done', 'acknowledged'))
+    assert plan['set_background_color'] == BLACK
+    assert plan['set_foreground_color'] == WHITE
+    assert plan['set_bold_color'] == WHITE
+    assert plan['set_use_tab_color'] is False
+    # Clearing the tab color doesn't rewrite the color itself
+    assert 'set_tab_color' not in plan
+
+
+def test_tab_color_from_none_enables_it():
+    plan = get_plan('acknowledged', 'done', visual_state.TAB_PROPERTIES)
+    assert plan == (
+        ('set_use_tab_color', True), ('set_use_tab_color_dark', True),
+        ('set_tab_color', WHITE), ('set_tab_color_dark', WHITE),
+    )
+
+
+def test_properties_limit_the_plan():
+    plan = get_plan(None, 'done', visual_state.WINDOW_PROPERTIES)
+    assert not [s for s in setters(plan) if 'tab_color' in s]
+    assert get_plan(None, 'acknowledged', ('background', 'foreground')) == (
+        ('set_background_color', BLACK), ('set_background_color_dark', BLACK),
+        ('set_foreground_color', WHITE), ('set_foreground_color_dark', WHITE),
+    )
+
+
+def test_per_property_origin():
+    # Screen already black, tab color last set by done
+    known = {'background': 'acknowledged', 'foreground': 'acknowledged',
+             'bold': 'acknowledged', 'tab_color': 'done'}
+    assert get_plan(known, 'acknowledged') == (
+        ('set_use_tab_color', False), ('set_use_tab_color_dark', False),
+    )
+
+
+def test_unknown_property_origin_is_written():
+    known = {'background': 'acknowledged'}
+    plan = get_plan(known, 'acknowledged', visual_state.WINDOW_PROPERTIES)
+    assert plan == get_plan(None, 'acknowledged', ('foreground', 'bold'))
+
+
+def test_compile_plans_only_covers_properties_a_state_sets():
+    plans = compile_plans({
+        'a': {'background': BLACK},
+        'b': {'background': WHITE, 'tab_color': None},
+    })
+    assert set(plans) == {
+        ('background', None, 'a'), ('background', 'a', 'a'), ('background', 'b', 'a'),
+        ('background', None, 'b'), ('background', 'a', 'b'), ('background', 'b', 'b'),
+        ('tab_color', None, 'b'), ('tab_color', 'a', 'b'), ('tab_color', 'b', 'b'),
+    }
+    assert plans[('background', 'a', 'a')] == ()
+    # 'a' leaves the tab color unchanged, so it is unknown coming from 'a'
+    assert plans[('tab_color', 'a', 'b')] == (
+        ('set_use_tab_color', False), ('set_use_tab_color_dark', False))
+
+
+def test_property_writes_unknown_value():
+    assert visual_state.property_writes('bold', MISSING, BLACK) == [
+        ('set_bold_color', BLACK), ('set_bold_color_dark', BLACK)]
+    assert visual_state.property_writes('bold', BLACK, BLACK) == []
@@ -3,7 +3,7 @@
 Background daemon that monitors keystrokes and changes window color on typing.
 When user types, flips the screen back to black.
 
-Usage: typing_monitor.py start|stop
+Usage: typing_monitor.py start|stop|health
 """
 import sys
 import os
@@ -15,43 +15,17 @@ VENV_PYTHON = os.path.expanduser('~/.claude/iterm/.venv/bin/python3')
 SCRIPT_DIR = os.path.expanduser('~/.claude/iterm')
 
 
-def get_ancestor_pids():
-    """Walk up the process tree and return all ancestor PIDs."""
-    pids = set()
-    pid = os.getpid()
-    while pid > 1:
-        pids.add(pid)
-        try:
-            result = subprocess.run(
-                ['ps', '-o', 'ppid=', '-p', str(pid)],
-                capture_output=True, text=True
-            )
-            if result.returncode != 0:
-                break
-            pid = int(result.stdout.strip())
-        except (ValueError, subprocess.SubprocessError):
-            break
-    return pids
-
-
-def find_session_id_by_process_tree():
-    """Find the iTerm session ID by matching process tree."""
+def find_session_id():
+    """Find the iTerm session ID by controlling tty, then process tree."""
     import iterm2
+    import session_tty
 
-    ancestor_pids = get_ancestor_pids()
+    resolution = session_tty.start_resolution()
 
     async def find_session(connection):
         app = await iterm2.async_get_app(connection)
-        for window in app.terminal_windows:
-            for tab in window.tabs:
-                for session in tab.sessions:
-                    try:
-                        session_pid = await session.async_get_variable('pid')
-                        if session_pid and int(session_pid) in ancestor_pids:
-                            return session.session_id
-                    except Exception:
-                        continue
-        return None
+        session = await session_tty.find_session(app, resolution, focused=False)
+        return session.session_id if session else None
 
     try:
         return iterm2.run_until_complete(find_session)
@@ -68,51 +42,83 @@ def get_pid_file(session_id):
 
 def run_monitor():
     """Run the keystroke monitor (called in background process)."""
+    import asyncio
     import iterm2
+    import daemon
+    import visual_state
 
     # Get session ID from environment (passed by start())
     session_id = os.environ.get('TYPING_MONITOR_SESSION_ID', '')
 
+    def on_terminate(signum, _frame):
+        # stop() sends SIGTERM; record it so the health record isn't left
+        # saying 'connected', then die as before
+        daemon.write_health('typing_monitor', session_id, 'stopped')
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    signal.signal(signal.SIGTERM, on_terminate)
+
     async def main(connection):
         app = await iterm2.async_get_app(connection)
 
         # Find the actual session object
         target_session = app.get_session_by_id(session_id) if session_id else None
+        if session_id and not target_session:
+            raise daemon.SessionGone(session_id)
+
+        # Only the session object is needed from here on
+        await daemon.async_release_app(connection, app)
+        app = None
+        footprint = daemon.Footprint('typing_monitor', session_id)
 
         # Use session ID for KeystrokeMonitor if available
         monitor_session = session_id if session_id else None
 
-        async with iterm2.KeystrokeMonitor(connection, session=monitor_session) as mon:
-            while True:
-                keystroke = await mon.async_get()
-
-                # Any keystroke triggers flip to black for THIS session only
-                if target_session:
-                    # Change only this session's color directly
-                    try:
-                        profile = await target_session.async_get_profile()
-                        black = iterm2.Color(0, 0, 0)
-                        white = iterm2.Color(255, 255, 255)
-                        await profile.async_set_background_color(black)
-                        await profile.async_set_background_color_dark(black)
-                        await profile.async_set_foreground_color(white)
-                        await profile.async_set_foreground_color_dark(white)
-                    except Exception:
-                        pass
-                else:
-                    # Fallback: use window_color.py (will use process tree)
-                    subprocess.Popen(
-                        [VENV_PYTHON,
-                         os.path.join(SCRIPT_DIR, 'window_color.py'),
-                         'black'],
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                    )
-
-    try:
-        iterm2.run_until_complete(main, retry=True)
-    except Exception:
-        pass
+        async def watch_keystrokes():
+            async with iterm2.KeystrokeMonitor(connection, session=monitor_session) as mon:
+                while True:
+                    keystroke = await mon.async_get()
+                    footprint.frame()
+                    footprint.check()
+
+                    # Any keystroke triggers flip to black for THIS session only
+                    if target_session:
+                        # Change only this session's background and text
+                        # colors; once acknowledged, further keystrokes have
+                        # nothing to write
+                        try:
+                            await visual_state.async_transition(
+                                target_session, 'acknowledged',
+                                ('background', 'foreground'))
+                        except Exception:
+                            pass
+                    else:
+                        # Fallback: use window_color.py (will use process tree)
+                        subprocess.Popen(
+                            [VENV_PYTHON,
+                             os.path.join(SCRIPT_DIR, 'window_color.py'),
+                             'black'],
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL,
+                        )
+
+        async def watch_termination():
+            async with iterm2.SessionTerminationMonitor(connection) as mon:
+                while await mon.async_get() != session_id:
+                    pass
+
+        waiters = [asyncio.ensure_future(watch_keystrokes())]
+        if session_id:
+            waiters.append(asyncio.ensure_future(watch_termination()))
+        done, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()  # Re-raise keystroke monitor errors
+        raise daemon.SessionGone(session_id)
+
+    daemon.run(main, 'typing_monitor', session_id)
 
 
 def stop_process(session_id=None):
@@ -121,7 +127,7 @@ def stop_process(session_id=None):
     if not session_id:
         session_id = os.environ.get('ITERM_SESSION_ID', '')
         if not session_id:
-            session_id = find_session_id_by_process_tree()
+            session_id = find_session_id()
 
     pid_file = get_pid_file(session_id)
     if os.path.exists(pid_file):
@@ -146,7 +152,7 @@ def start():
 
     if not session_id:
         # Fall back to process tree detection
-        session_id = find_session_id_by_process_tree()
+        session_id = find_session_id()
 
     stop_process(session_id)
 
@@ -177,7 +183,7 @@ def stop():
     if session_id and ':' in session_id:
         session_id = session_id.split(':', 1)[1]
     if not session_id:
-        session_id = find_session_id_by_process_tree()
+        session_id = find_session_id()
 
     stop_process(session_id)
     print("Typing monitor stopped")
@@ -185,7 +191,7 @@ def stop():
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print('Usage: typing_monitor.py start|stop')
+        print('Usage: typing_monitor.py start|stop|health')
         sys.exit(1)
 
     cmd = sys.argv[1].lower()
@@ -195,3 +201,11 @@ if __name__ == '__main__':
         stop()
     elif cmd == 'run':
         run_monitor()
+    elif cmd == 'health':
+        import daemon
+        session_id = os.environ.get('ITERM_SESSION_ID', '')
+        if session_id and ':' in session_id:
+            session_id = session_id.split(':', 1)[1]
+        if not session_id:
+            session_id = find_session_id()
+        print(daemon.read_health('typing_monitor', session_id))
@@ -0,0 +1,166 @@
+"""
+Declarative visual states for a Claude Code session.
+
+Each state maps to the visual properties it sets; a property a state leaves
+out is left unchanged. The writes for every property of every (from, to)
+pair are compiled once at import, so applying a transition only sends the
+profile setters whose values actually differ.
+
+The state that last set each property is tracked per session, so scripts
+that own different properties (window_color.py the screen colors,
+tab_color.py the tab color) don't invalidate each other.
+
+The title animation is not a visual state: animate_title.py runs it
+between the start and stop hooks.
+
+States:
+  done          - Claude stopped and is waiting (screen and tab flash white)
+  acknowledged  - you started typing (screen back to black, tab color off)
+"""
+import os
+
+# ====== CONFIGURATION SECTION ======
+# Colors are 8-bit RGB tuples; tab_color None means "no tab color".
+STATES = {
+    "done": {
+        "background": (255, 255, 255),
+        "foreground": (0, 0, 0),
+        "bold": (0, 0, 0),
+        "tab_color": (255, 255, 255),
+    },
+    "acknowledged": {
+        "background": (0, 0, 0),
+        "foreground": (255, 255, 255),
+        "bold": (255, 255, 255),
+        "tab_color": None,
+    },
+}
+# ====== END CONFIGURATION SECTION ======
+
+PROPERTIES = ("background", "foreground", "bold", "tab_color")
+
+# Properties owned by window_color.py and tab_color.py
+WINDOW_PROPERTIES = ("background", "foreground", "bold")
+TAB_PROPERTIES = ("tab_color",)
+
+# Profile setters for each color property (light and dark mode variants)
+COLOR_SETTERS = {
+    "background": ("set_background_color", "set_background_color_dark"),
+    "foreground": ("set_foreground_color", "set_foreground_color_dark"),
+    "bold": ("set_bold_color", "set_bold_color_dark"),
+}
+
+# Stands in for a property whose current value is unknown
+MISSING = object()
+
+
+def property_writes(prop, old, new):
+    """Return the (setter, value) writes needed to move prop from old to new.
+
+    Pass old=MISSING when the current value is unknown so it is written.
+    """
+    if old == new:
+        return []
+    if prop == "tab_color":
+        if new is None:
+            return [("set_use_tab_color", False), ("set_use_tab_color_dark", False)]
+        writes = []
+        if old is None or old is MISSING:
+            writes += [("set_use_tab_color", True), ("set_use_tab_color_dark", True)]
+        return writes + [("set_tab_color", new), ("set_tab_color_dark", new)]
+    return [(setter, new) for setter in COLOR_SETTERS[prop]]
+
+
+def compile_plans(states):
+    """Precompute the minimal writes for every property of every transition.
+
+    Keys are (property, from_state, to_state) for each property to_state
+    sets; from_state None means the property's current value is unknown
+    and it is written.
+    """
+    plans = {}
+    for to_name, to_props in states.items():
+        for prop, new in to_props.items():
+            plans[(prop, None, to_name)] = tuple(property_writes(prop, MISSING, new))
+            for from_name, from_props in states.items():
+                old = from_props.get(prop, MISSING)
+                plans[(prop, from_name, to_name)] = tuple(property_writes(prop, old, new))
+    return plans
+
+
+PLANS = compile_plans(STATES)
+
+
+def get_plan(from_state, to_state, properties=PROPERTIES):
+    """Return the precompiled writes for a transition.
+
+    from_state is the state that last set every property, or a dict giving
+    it per property; None (or a missing key) means unknown. Only the given
+    properties that to_state sets are written.
+    """
+    writes = ()
+    for prop in PROPERTIES:
+        if prop not in properties or prop not in STATES[to_state]:
+            continue
+        origin = from_state.get(prop) if isinstance(from_state, dict) else from_state
+        if origin not in STATES:
+            origin = None
+        writes += PLANS[(prop, origin, to_state)]
+    return writes
+
+
+def get_state_file(session_id, prop):
+    """Get session- and property-specific file recording the state that set it."""
+    safe_id = session_id.replace(':', '_').replace('/', '_') if session_id else 'default'
+    return f'/tmp/iterm_visual_state_{safe_id}_{prop}.txt'
+
+
+def get_state(session_id, prop):
+    """Return the state that last set prop for a session, or None if unknown."""
+    try:
+        with open(get_state_file(session_id, prop)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_state(session_id, prop, state):
+    with open(get_state_file(session_id, prop), 'w') as f:
+        f.write(state)
+
+
+def forget_state(session_id, properties=PROPERTIES):
+    """Mark properties of a session unknown (they were changed elsewhere)."""
+    for prop in properties:
+        try:
+            os.remove(get_state_file(session_id, prop))
+        except FileNotFoundError:
+            pass
+
+
+async def async_apply_plan(session, plan):
+    """Send a plan's profile writes to a session.
+
+    The profile is only fetched when there is something to write.
+    """
+    import iterm2
+
+    if not plan:
+        return
+    profile = await session.async_get_profile()
+    for setter, value in plan:
+        if isinstance(value, tuple):
+            value = iterm2.Color(*value)
+        await getattr(profile, 'async_' + setter)(value)
+
+
+async def async_transition(session, to_state, properties=PROPERTIES):
+    """Move a session's properties to to_state, writing only what differs.
+
+    Only the given properties that to_state sets are touched.
+    """
+    props = [prop for prop in properties if prop in STATES[to_state]]
+    known = {prop: get_state(session.session_id, prop) for prop in props}
+    await async_apply_plan(session, get_plan(known, to_state, props))
+    for prop in props:
+        set_state(session.session_id, prop, to_state)
@@ -6,53 +6,10 @@ Usage: window_color.py [color]  (e.g., white, black, red)
 """
 import iterm2
 import sys
-import os
-
-
-def get_ancestor_pids():
-    """Walk up the process tree and return all ancestor PIDs."""
-    pids = set()
-    try:
-        pid = os.getpid()
-        while pid > 1:
-            pids.add(pid)
-            # Get parent PID
-            with open(f'/proc/{pid}/stat', 'r') as f:
-                stat = f.read().split()
-                pid = int(stat[3])  # ppid is 4th field
-    except FileNotFoundError:
-        # macOS doesn't have /proc, use subprocess
-        import subprocess
-        pid = os.getpid()
-        while pid > 1:
-            pids.add(pid)
-            try:
-                result = subprocess.run(
-                    ['ps', '-o', 'ppid=', '-p', str(pid)],
-                    capture_output=True, text=True
-                )
-                if result.returncode != 0:
-                    break
-                pid = int(result.stdout.strip())
-            except (ValueError, subprocess.SubprocessError):
-                break
-    return pids
-
-
-async def find_session_by_process_tree(app):
-    """Find the iTerm session that is an ancestor of our process."""
-    ancestor_pids = get_ancestor_pids()
-
-    for window in app.terminal_windows:
-        for tab in window.tabs:
-            for session in tab.sessions:
-                try:
-                    session_pid = await session.async_get_variable('pid')
-                    if session_pid and int(session_pid) in ancestor_pids:
-                        return session
-                except Exception:
-                    continue
-    return None
+
+import session_tty
+import visual_state
+
 
 # ====== CONFIGURATION SECTION ======
 # List the color names you want to cycle through:
@@ -67,8 +24,9 @@ BASE_COLORS_255 = {
     "pink":   (16, 0, 25),     # Same as purple (synonym)
     "orange": (25, 8, 0),      # 10% orange (100% red, 33% green)
     "brown":  (25, 8, 0),      # Same as orange (synonym)
-    "black":  (0, 0, 0),       # Reset to black (no tint)
-    "white":  (255, 255, 255), # Bright white for flash
+    # Flash and reset colors come from the visual states (visual_state.py)
+    "black":  visual_state.STATES["acknowledged"]["background"],
+    "white":  visual_state.STATES["done"]["background"],
     # "Done" colors - clearly visible but not blinding
     "done":   (120, 120, 130), # Medium gray - clearly visible
     "dim":    (80, 80, 90),    # Subtle gray
@@ -78,8 +36,14 @@ BASE_COLORS_255 = {
 
 # Foreground colors - dark for light backgrounds, light for dark backgrounds
 FOREGROUND_COLORS_255 = {
-    "white":  (0, 0, 0),       # Black text on white background
-    "default": (255, 255, 255), # White text on dark backgrounds
+    "white":  visual_state.STATES["done"]["foreground"],          # Text on white
+    "default": visual_state.STATES["acknowledged"]["foreground"], # Text on dark tints
+}
+
+# Colors that correspond to a visual state (see visual_state.py)
+COLOR_STATES = {
+    "white": "done",
+    "black": "acknowledged",
 }
 
 # Factor to darken colors; 1.0 = use values as-is (default)
@@ -122,7 +86,14 @@ async def change_session_background(session, backgrounds, target_color=None):
 
     If target_color is provided, sets that specific color.
     Otherwise, cycles to the next dark color based on current background.
+    Colors that map to a visual state only send what differs from the
+    session's current state.
     """
+    if target_color in COLOR_STATES:
+        await visual_state.async_transition(session, COLOR_STATES[target_color],
+                                            visual_state.WINDOW_PROPERTIES)
+        return
+
     profile = await session.async_get_profile()
 
     if target_color:
@@ -167,6 +138,9 @@ async def change_session_background(session, backgrounds, target_color=None):
     await profile.async_set_bold_color(fg_color)
     await profile.async_set_bold_color_dark(fg_color)
 
+    # Colors no longer match a known state; next transition writes them
+    visual_state.forget_state(session.session_id, visual_state.WINDOW_PROPERTIES)
+
 
 async def main(connection):
     app = await iterm2.app.async_get_app(connection)
@@ -179,31 +153,12 @@ async def main(connection):
         # Nothing configured, nothing to do
         return
 
-    # Strategy 1: Try ITERM_SESSION_ID environment variable
-    session_id = os.environ.get('ITERM_SESSION_ID')
-    if session_id:
-        # Extract the actual session ID (format: w0t0p0:actual-session-id)
-        if ':' in session_id:
-            session_id = session_id.split(':', 1)[1]
-        session = app.get_session_by_id(session_id)
-        if session:
-            await change_session_background(session, backgrounds, target_color)
-            return
-
-    # Strategy 2: Find session by walking process tree
-    session = await find_session_by_process_tree(app)
+    # ITERM_SESSION_ID, then tty, then process tree, then the focused
+    # session (see session_tty.py)
+    session = await session_tty.find_session(app, RESOLUTION)
     if session:
         await change_session_background(session, backgrounds, target_color)
-        return
-
-    # Strategy 3: Fallback to current focused session only
-    window = app.current_window
-    if window:
-        tab = window.current_tab
-        if tab:
-            session = tab.current_session
-            if session:
-                await change_session_background(session, backgrounds, target_color)
 
 
+RESOLUTION = session_tty.start_resolution()
 iterm2.run_until_complete(main)